@@ -1,31 +1,93 @@
 # app.py
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from google.cloud import firestore
 from datetime import datetime
 import uuid
 import json
+import os
+import orjson
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson instead of the stdlib"""
+    
+    def _options(self, indent=False, sort_keys=None):
+        # Pass datetimes through to Flask's default hook so Firestore
+        # timestamps keep the same HTTP-date format as before
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if self.sort_keys if sort_keys is None else sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return option
+    
+    def dumps(self, obj, **kwargs):
+        option = self._options(kwargs.get('indent'), kwargs.get('sort_keys'))
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of going
+        # through dumps(), which would decode to str only to re-encode it
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        option = self._options(indent) | orjson.OPT_APPEND_NEWLINE
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=option),
+            mimetype=self.mimetype
+        )
 
 app = Flask(__name__)
-CORS(app)
+app.json = ORJSONProvider(app)
+
+# Reject oversized bodies from Content-Length before they are read or parsed
+app.config['MAX_CONTENT_LENGTH'] = int(
+    os.environ.get('MAX_CONTENT_LENGTH', 10 * 1024 * 1024)
+)
+
+# Cache preflight responses so the editor's JSON POST/PUT calls
+# (including autosave) don't pay an extra OPTIONS round trip each time
+CORS(
+    app,
+    origins=[origin.strip()
+             for origin in os.environ.get('ALLOWED_ORIGINS', '*').split(',')
+             if origin.strip()],
+    max_age=86400
+)
 
 # Initialize Firestore
 db = firestore.Client()
 
+# Fields returned by list endpoints; the heavy layers/assets/projectData
+# blobs are only served when a single document is requested
+PROJECT_LIST_FIELDS = [
+    'id', 'name', 'createdAt', 'modifiedAt', 'settings', 'version', 'isTemplate'
+]
+TEMPLATE_LIST_FIELDS = [
+    'id', 'name', 'description', 'category', 'creatorId', 'creatorName',
+    'createdAt', 'downloads', 'rating', 'price', 'previewUrl', 'tags'
+]
+
 class ProjectManager:
     def __init__(self):
         self.db = db
+        self.users = db.collection('users')
+        self.templates = db.collection('templates')
     
     def create_project(self, user_id, project_data):
         """Create a new project for user"""
-        project_ref = self.db.collection('users').document(user_id).collection('projects')
+        project_ref = self.users.document(user_id).collection('projects')
         project_id = str(uuid.uuid4())
+        now = datetime.utcnow()
         
         project = {
             'id': project_id,
             'name': project_data.get('name', 'Untitled Project'),
-            'createdAt': datetime.utcnow(),
-            'modifiedAt': datetime.utcnow(),
+            'createdAt': now,
+            'modifiedAt': now,
             'settings': {
                 'resolution': project_data.get('resolution', '1080p'),
                 'fps': project_data.get('fps', 30),
@@ -37,18 +99,20 @@ class ProjectManager:
             'isTemplate': project_data.get('isTemplate', False)
         }
         
-        project_ref.document(project_id).set(project)
-        
-        # Update user's project count
-        user_ref = self.db.collection('users').document(user_id)
-        user_ref.update({'projectsCount': firestore.Increment(1)})
+        # Save project and update user's project count in one commit
+        batch = self.db.batch()
+        batch.set(project_ref.document(project_id), project)
+        batch.update(self.users.document(user_id), {'projectsCount': firestore.Increment(1)})
+        batch.commit()
         
         return project_id
     
     def get_user_projects(self, user_id):
         """Get all projects for a user"""
-        projects_ref = self.db.collection('users').document(user_id).collection('projects')
-        docs = projects_ref.order_by('modifiedAt', direction=firestore.Query.DESCENDING).stream()
+        projects_ref = self.users.document(user_id).collection('projects')
+        docs = (projects_ref.select(PROJECT_LIST_FIELDS)
+                .order_by('modifiedAt', direction=firestore.Query.DESCENDING)
+                .stream())
         
         projects = []
         for doc in docs:
@@ -58,9 +122,21 @@ class ProjectManager:
         
         return projects
     
+    def get_project(self, user_id, project_id):
+        """Get a single project with its full layer and asset data"""
+        project_ref = self.users.document(user_id).collection('projects').document(project_id)
+        project_doc = project_ref.get()
+        
+        if not project_doc.exists:
+            return None
+        
+        project_data = project_doc.to_dict()
+        project_data['id'] = project_doc.id
+        return project_data
+    
     def update_project(self, user_id, project_id, update_data):
         """Update project data"""
-        project_ref = self.db.collection('users').document(user_id).collection('projects').document(project_id)
+        project_ref = self.users.document(user_id).collection('projects').document(project_id)
         
         update_data['modifiedAt'] = datetime.utcnow()
         update_data['version'] = firestore.Increment(1)
@@ -71,7 +147,7 @@ class ProjectManager:
     
     def save_as_template(self, user_id, project_id, template_data):
         """Save project as community template"""
-        project_ref = self.db.collection('users').document(user_id).collection('projects').document(project_id)
+        project_ref = self.users.document(user_id).collection('projects').document(project_id)
         project_doc = project_ref.get()
         
         if not project_doc.exists:
@@ -100,18 +176,18 @@ class ProjectManager:
             'tags': template_data.get('tags', [])
         }
         
-        # Save to templates collection
-        self.db.collection('templates').document(template_id).set(template)
-        
-        # Update user's template count
-        user_ref = self.db.collection('users').document(user_id)
-        user_ref.update({'templatesCreated': firestore.Increment(1)})
+        # Save to templates collection and update user's template count
+        # in one commit
+        batch = self.db.batch()
+        batch.set(self.templates.document(template_id), template)
+        batch.update(self.users.document(user_id), {'templatesCreated': firestore.Increment(1)})
+        batch.commit()
         
         return template_id
     
     def get_templates(self, category=None, limit=20):
         """Get community templates with optional filtering"""
-        templates_ref = self.db.collection('templates')
+        templates_ref = self.templates.select(TEMPLATE_LIST_FIELDS)
         
         if category:
             query = templates_ref.where('category', '==', category)
@@ -147,6 +223,14 @@ def get_projects(user_id):
     projects = project_manager.get_user_projects(user_id)
     return jsonify({'projects': projects})
 
+@app.route('/api/projects/<user_id>/<project_id>', methods=['GET'])
+def get_project(user_id, project_id):
+    project = project_manager.get_project(user_id, project_id)
+    
+    if project:
+        return jsonify({'project': project})
+    return jsonify({'error': 'Project not found'}), 404
+
 @app.route('/api/projects/<user_id>/<project_id>', methods=['PUT'])
 def update_project(user_id, project_id):
     data = request.json
@@ -174,5 +258,9 @@ def get_templates():
     templates = project_manager.get_templates(category, limit)
     return jsonify({'templates': templates})
 
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': 'Request body too large'}), 413
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
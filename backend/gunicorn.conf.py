@@ -0,0 +1,40 @@
+# gunicorn.conf.py
+# Production server settings for the Flask API: gunicorn app:app
+import logging
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# One process per core pair plus one, each with a few threads to overlap
+# blocking Firestore calls. Green-thread workers (eventlet/gevent) are not
+# used because the Firestore client runs on gRPC, which doesn't support
+# monkey patching.
+#
+# This multi-process setup is only for the project/template API in app.py.
+# The render routes in video_processor.py (video_bp) keep job state, the
+# NVENC probe and a 2-thread FFmpeg pool per process: a poll landing on a
+# different worker would 404, and every worker would run its own encodes.
+# Serve any app that mounts video_bp as a separate single-process
+# deployment instead, e.g. `gunicorn -w 1 --threads 8 <render_app>:app`.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Keep connections from the editor's autosave open between requests
+keepalive = 75
+timeout = 120
+
+# The app is imported in each worker after fork so every process builds
+# its own Firestore client and gRPC channel
+preload_app = False
+
+def post_worker_init(worker):
+    """Send app loggers (e.g. video_processor) to gunicorn's error log"""
+    # gunicorn only configures its own gunicorn.error/gunicorn.access
+    # loggers, so records from app modules would otherwise fall through to
+    # logging.lastResort on bare stderr and miss any errorlog file
+    error_log = logging.getLogger('gunicorn.error')
+    root = logging.getLogger()
+    root.handlers = list(error_log.handlers)
+    root.setLevel(error_log.level)